@@ -1,5 +1,9 @@
 """Generate the cweno extension module."""
 
+from __future__ import print_function
+
+from multiprocessing import Pool, cpu_count
+
 import jinja2
 import pyweno
 
@@ -12,8 +16,26 @@ with open('weno_smoothness.tmpl.c', 'r') as f:
 with open('weno_reconstruction.tmpl.c', 'r') as f:
   reconstruction = jinja2.Template(f.read())
 
-for k in range(3, 4):
-  print 'k:', k
+K      = range(3, 4)
+POINTS = [ 'left', 'right', 'middle' ]
+#          'gauss_legendre', 'gauss_lobatto', 'gauss_radau' ]
+
+
+def reconstruction_points(pts, k):
+  """Return the function that computes the reconstruction points and
+  the list of the number of points to generate for *pts*."""
+
+  if pts == 'left':
+    return (lambda n: [ -1 ]), [ 1 ]
+  elif pts == 'right':
+    return (lambda n: [ 1 ]), [ 1 ]
+  elif pts == 'middle':
+    return (lambda n: [ 0 ]), [ 1 ]
+
+  return getattr(pyweno.points, pts), range(2, k+1)
+
+
+def build_smoothness(k):
   kernel = pyweno.kernels.KernelGenerator('c', order=2*k-1)
   ksmoothness = kernel.smoothness(reuse=True)
 
@@ -22,42 +44,57 @@ for k in range(3, 4):
     f.write(smoothness.render(
         name=name, k=k, burnin=kernel.burnin, kernel=ksmoothness))
 
-  for pts in [ 'left', 'right', 'middle' ]:
-#               'gauss_legendre', 'gauss_lobatto', 'gauss_radau' ]:
-
-    print '  point:', pts
-
-    if pts == 'left':
-      func = lambda n: [ -1 ]
-      N    = [ 1 ]
-    elif pts == 'right':
-      func = lambda n: [ 1 ]
-      N    = [ 1 ]
-    elif pts == 'middle':
-      func = lambda n: [ 0 ]
-      N    = [ 1 ]
-    else:
-      func = getattr(pyweno.points, pts)
-      N    = range(2, k+1)
-      xi   = func
-
-    for n in N:
-      kernel = pyweno.kernels.KernelGenerator('c', order=2*k-1, xi=func(n))
-      kweights = kernel.weights()
-      kreconstruction = kernel.reconstruction()
-      sigma = pyweno.symbols.sigma.all(k)
-      omega = pyweno.symbols.omega.all(n, k, kernel.split)
-      fr    = pyweno.symbols.fr.all(n, k)
-      fs    = pyweno.symbols.fs.all(n)
-
-      name = pts + '%03d%03d' % (k, n)
-      with open('../src/weno_' + name + '.c', 'w') as f:
-        f.write(reconstruction.render(
-            name=name, k=k, n=n,
-            omega=omega,
-            variables={'weights': [ x['name'] for x in sigma ],
-                       'reconstruct': [ x['name'] for x in sigma ]
-                                    + [ x['name'] for x in omega ]
-                                    + [ x['name'] for x in fr ]
-                                    + [ x['name'] for x in fs ] },
-            weights=kweights, reconstruction=kreconstruction))
+  print('k:', k, 'smoothness')
+
+
+def build_reconstruction(k, pts, n):
+  func, _ = reconstruction_points(pts, k)
+
+  kernel = pyweno.kernels.KernelGenerator('c', order=2*k-1, xi=func(n))
+  kweights = kernel.weights()
+  kreconstruction = kernel.reconstruction()
+  sigma = pyweno.symbols.sigma.all(k)
+  recip = pyweno.symbols.recip.all(k)
+  omega = pyweno.symbols.omega.all(n, k, kernel.split)
+  fr    = pyweno.symbols.fr.all(n, k)
+  fs    = pyweno.symbols.fs.all(n)
+
+  name = pts + '%03d%03d' % (k, n)
+  with open('../src/weno_' + name + '.c', 'w') as f:
+    f.write(reconstruction.render(
+        name=name, k=k, n=n,
+        omega=omega,
+        variables={'weights': [ x['name'] for x in sigma ]
+                            + [ x['name'] for x in omega ]
+                            + [ x['name'] for x in recip ]
+                            + [ 'acc' ],
+                   'reconstruct': [ x['name'] for x in sigma ]
+                                + [ x['name'] for x in omega ]
+                                + [ x['name'] for x in fr ]
+                                + [ x['name'] for x in fs ] },
+        weights=kweights, reconstruction=kreconstruction))
+
+  print('k:', k, 'point:', pts, 'n:', n)
+
+
+def build(task):
+  if task[0] == 'smoothness':
+    build_smoothness(*task[1:])
+  else:
+    build_reconstruction(*task[1:])
+
+
+if __name__ == '__main__':
+
+  tasks = []
+  for k in K:
+    tasks.append(('smoothness', k))
+    for pts in POINTS:
+      for n in reconstruction_points(pts, k)[1]:
+        tasks.append(('reconstruction', k, pts, n))
+
+  # each file is generated independently, so spread them over all cores
+  pool = Pool(cpu_count())
+  pool.map(build, tasks, chunksize=1)
+  pool.close()
+  pool.join()
@@ -8,3 +8,5 @@ import symbols
 import version
 import weno
 import cweno
+import opencl
+import vectorized
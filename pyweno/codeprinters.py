@@ -6,13 +6,31 @@ from sympy.printing.precedence import precedence
 
 
 class FCodePrinter(SympyFCodePrinter):
-  pass
+  def _print_fma(self, expr):
+    a, b, c = expr.args
+    return '(%s + %s)' % (self._print(c), self._print(a*b))
+  def _print_fmax(self, expr):
+    return 'max(%s)' % self.stringify(expr.args, ', ')
 
 class CCodePrinter(SympyCCodePrinter):
+  _default_settings = dict(SympyCCodePrinter._default_settings, float_suffix='')
+  def _print_Float(self, expr):
+    s = super(CCodePrinter,self)._print_Float(expr)
+    return s + self._settings['float_suffix']
   def _print_Pow(self, expr):
     if expr.exp == 2:
       PREC = precedence(expr)
       s = str(self.parenthesize(expr.base, PREC))
       return '%s*%s' % (s,s)
+    elif expr.exp == -1:
+      PREC = precedence(expr)
+      s = str(self.parenthesize(expr.base, PREC))
+      return '1.0%s/%s' % (self._settings['float_suffix'], s)
     else:
       return super(CCodePrinter,self)._print_Pow(expr)
+  def _print_fma(self, expr):
+    return 'fma(%s)' % self.stringify(expr.args, ', ')
+  def _print_fmax(self, expr):
+    return 'fmax(%s)' % self.stringify(expr.args, ', ')
+  def _print_native_recip(self, expr):
+    return 'native_recip(%s)' % self._print(expr.args[0])
@@ -1,5 +1,10 @@
 """PyWENO code generation tool kit (kernels)."""
 
+import re
+
+from collections import OrderedDict
+
+import numpy as np
 import sympy
 import codeprinters
 
@@ -17,6 +22,7 @@ class KernelGenerator(object):
 
   * smoothness indicators: *sigma*, default ``sigmaX``
   * weights: *omega*, default ``omegaX``
+  * reciprocal denominators of the weights: *recip*, default ``recipX``
   * intermediate reconstructions: *fr*, default ``frX``.
 
   For each of the above, the occurance of ``X`` is replaced by the
@@ -26,22 +32,41 @@ class KernelGenerator(object):
   accumulator variable ``acc`` is also assumed to be in scope.
 
   :param lang: ``'c'``, ``'opencl'``, or ``'fortran'``
+  :param fma: emit reconstructions as chains of fused multiply-adds
+              (default: ``True`` for OpenCL, ``False`` otherwise)
+  :param dtype: ``'double'``, ``'float'``, or ``'half'`` (OpenCL only)
+
+  The floating point type *dtype* determines the suffix of the
+  emitted literals and the type of any constant arrays.  For OpenCL,
+  the *preamble* attribute holds the ``#pragma`` that enables the
+  corresponding extension (if any) and should be placed at the top of
+  the program.
 
   """
 
-  def __init__(self, lang, order=None, xi=None, **kwargs):
+  def __init__(self, lang, order=None, xi=None, fma=None, dtype='double', **kwargs):
     import symbols
     if order is not None:
       self.k = (order + 1) / 2
       self.xi = xi
     self.lang = lang.lower()
+    self.fma = self.lang == 'opencl' if fma is None else fma
     self.weights_normalised = False
+    self._declarations = OrderedDict()
+    self.constants = ''
+
+    if dtype not in _dtypes[self.lang]:
+      raise ValueError("'dtype' must be one of: " + ', '.join(_dtypes[self.lang]))
+    self.dtype = dtype
+    self.preamble = _extensions.get((self.lang, dtype), '')
+
     symbols.names.lang = lang.lower()
 
 
   #############################################################################
 
-  def smoothness(self, reuse=False, beta=None):
+  def smoothness(self, reuse=False, beta=None, rolled=False, hoist=False,
+                 squares=False, products=False):
     r"""Fully un-rolled smoothness indicator kernel for uniform
     grids.
 
@@ -55,54 +80,131 @@ class KernelGenerator(object):
                          \beta_{r,m,n}\, \overline{f}_{i-k+m}\,
                                          \overline{f}_{i-k+n}.
 
+    If *rolled* is ``True`` (C and OpenCL only), the coefficients are
+    stored in constant arrays and each :math:`\sigma_r` is computed
+    by a short loop (with an unroll hint for OpenCL) instead.  The
+    constant array declarations are added to the *constants*
+    attribute (which accumulates the declarations of all the kernels
+    generated so far) and should be placed at file scope.
+
+    If *hoist* is ``True`` (C and OpenCL only), the kernel is still
+    fully un-rolled but the coefficients are read from the same
+    constant arrays (with literal indices) instead of being inlined.
+
+    If *squares* is ``True``, each :math:`\sigma_r` is computed as a
+    weighted sum of squares of linear combinations of the cell
+    averages (see :func:`pyweno.symbolic.smoothness_sum_of_squares`),
+    which needs roughly half as many multiplications.  Each linear
+    combination is stored in the accumulator ``acc``.
+
+    If *products* is ``True``, each unique product
+    :math:`\overline{f}_{i+m}\, \overline{f}_{i+n}` is computed once
+    (and stored in *fmn*, default ``fXY``) before the smoothness
+    indicators are accumulated from them, instead of being recomputed
+    for every :math:`\sigma_r` that uses it.  The names of the
+    products are available through ``pyweno.symbols.fmn.all(k)``.
+
     """
 
-    from symbols import sigma, fmn, f
+    from symbols import names, real, sigma, fmn, f, fma
 
-    kernel = Kernel()
+    kernel = Kernel(self.lang, self.dtype)
 
     if beta is None:
-      beta = getattr(self, 'beta', symbolic.jiang_shu_smoothness_coefficients(self.k))
+      beta = getattr(self, 'beta', None)
+    if beta is None:
+      beta = symbolic.jiang_shu_smoothness_coefficients(self.k)
 
     k  = beta.get('k', 0)
     nc = beta.get('l', k)
 
-    if not reuse:
+    idx = zip(*[ x.tolist() for x in np.triu_indices(nc) ])
+
+    if squares and (reuse or rolled or hoist or products):
+      raise ValueError('sum of squares smoothness kernels can not be '
+                       + 'rolled, hoisted, or reuse products')
+
+    if products and (reuse or rolled):
+      raise ValueError('unique product smoothness kernels can not be '
+                       + 'rolled or reuse products')
+
+    coeffs = beta
+    if rolled or hoist:
+      self._check_lang('rolled' if rolled else 'hoisted')
+      coeffs = {}
+      for r in range(k):
+        b = names.beta.format(r)
+        kernel.constant(b, [ beta[r,m,n] for m, n in idx ])
+        for t, (m, n) in enumerate(idx):
+          coeffs[r,m,n] = real('%s[%d]' % (b, t))
+
+    if squares:
+      c, L = symbolic.smoothness_sum_of_squares(beta)
+      dot = _fma_dot if self.fma else _dot
+      accsym = real('acc')
+
+      for r in range(k):
+        first = True
+        for s in range(nc):
+          if (r, s) not in c:
+            continue
+          kernel.assign(accsym, dot([ (L[r,s,j], f[-r+j]) for j in range(s, nc) ]))
+          if first:
+            kernel.assign(sigma[r], c[r,s] * accsym**2)
+          elif self.fma:
+            kernel.assign(sigma[r], fma(c[r,s] * accsym, accsym, sigma[r]))
+          else:
+            kernel.assign(sigma[r], sigma[r] + c[r,s] * accsym**2)
+          first = False
+
+    elif rolled:
+      if reuse:
+        raise ValueError('rolled smoothness kernels can not reuse products')
+
+      bm, bn = names.beta_i.format('m'), names.beta_i.format('n')
+      kernel.constant(bm, [ m for m, n in idx ], 'int')
+      kernel.constant(bn, [ n for m, n in idx ], 'int')
+
+      for r in range(k):
+        b = names.beta.format(r)
+        kernel.src.append('%s = %s;' % (sigma[r], kernel.zero))
+        kernel.loop('t', len(idx), '%s += %s[t] * %s * %s;'
+                    % (sigma[r], b, f.expr('+%s[t]%+d' % (bm, -r)),
+                                    f.expr('+%s[t]%+d' % (bn, -r))))
+
+    elif products:
+      for pm, pn in fmn.pairs(k, nc):
+        kernel.assign(fmn[pm,pn], f[pm] * f[pn])
+
+      for r in range(k):
+        v = sympy.Add(*[ coeffs[r,m,n] * fmn[-r+m,-r+n] for m, n in idx ])
+        kernel.assign(sigma[r], v)
+
+    elif not reuse:
       for r in range(k):
-        v = sum([ beta[r,m,n] * f[-r+m] * f[-r+n]
-                  for m in range(nc)
-                  for n in range(m, nc) ])
+        v = sympy.Add(*[ coeffs[r,m,n] * f[-r+m] * f[-r+n] for m, n in idx ])
         kernel.assign(sigma[r], v)
 
     else:
 
       # first pass: compute all unique combinations of f[i-r+m] * f[i-r+n]
       #             usually this would be done for i=k once
-      burnin = Kernel()
-      burnt  = {}
-      for r in range(k):
-        for m in range(nc):
-          for n in range(m, nc):
-            if (-r+m,-r+n) not in burnt:
-              burnin.assign(fmn[-r+m,-r+n], f[-r+m] * f[-r+n])
-            burnt[-r+m,-r+n] = fmn[-r+m,-r+n]
+      pairs  = fmn.pairs(k, nc)
+      burnin = Kernel(self.lang, self.dtype)
+      for pm, pn in pairs:
+        burnin.assign(fmn[pm,pn], f[pm] * f[pn])
+      burnt = set(pairs)
 
       # second pass: assuming all unique f[i-r+m] * f[i-r+n] have already been computed,
       #              set/compute all unique f[i+1-r+m] * f[i+1-r+n]
-      cache   = {}
-      delayed = Kernel()
-      for r in range(k):
-        for m in range(nc):
-          for n in range(m, nc):
-            if (-r+m,-r+n) in cache:
-              continue
-            if (1-r+m,1-r+n) in burnt:
-              # set fmn[-r+m,-r+n] from previous pass
-              kernel.assign(fmn[-r+m,-r+n], fmn[1-r+m,1-r+n])
-            else:
-              # compute new fmn[-r+m,-r+n], delay until after all copies are done
-              delayed.assign(fmn[-r+m,-r+n], f[-r+m] * f[-r+n])
-            cache[-r+m,-r+n] = True
+      delayed = Kernel(self.lang, self.dtype)
+      for pm, pn in pairs:
+        if (pm+1,pn+1) in burnt:
+          # set fmn[-r+m,-r+n] from previous pass
+          kernel.assign(fmn[pm,pn], fmn[pm+1,pn+1])
+        else:
+          # compute new fmn[-r+m,-r+n], delay until after all copies are done
+          delayed.assign(fmn[pm,pn], f[pm] * f[pn])
 
       kernel.src.extend(delayed.src)
 
@@ -110,19 +212,19 @@ class KernelGenerator(object):
 
       # finally, using above compute sigma
       for r in range(k):
-        v = sum([ beta[r,m,n] * fmn[-r+m,-r+n]
-                  for m in range(nc)
-                  for n in range(m, nc) ])
+        v = sympy.Add(*[ coeffs[r,m,n] * fmn[-r+m,-r+n] for m, n in idx ])
         kernel.assign(sigma[r], v)
 
 
     self.beta = beta
+    self._declare(kernel)
     return kernel.body()
 
 
   #############################################################################
 
-  def weights(self, varpi=None, split=None, normalise=False, power=2, epsilon='1.0e-6'):
+  def weights(self, varpi=None, split=None, normalise=False, power=2, epsilon=None,
+              fast_math=False, fmax=False):
     r"""Fully un-rolled weights kernel for uniform grids.
 
     The weights kernel computes the weights :math:`\omega^r`
@@ -141,9 +243,25 @@ class KernelGenerator(object):
 
       \omega^r = \frac{\omega^r}{\sum_j \omega^j}
 
+    Both steps are emitted as a single division followed by
+    multiplications: the reciprocal of :math:`\sigma^r + \epsilon` is
+    raised to the power :math:`p` and stored in *recip* (once for each
+    :math:`r`, and shared by all the reconstruction points), and the
+    reciprocal of the sum of the weights is stored in ``acc``.
+
+    If *fmax* is ``True``, the denominator :math:`\sigma^r + \epsilon`
+    is replaced by :math:`\max(\sigma^r, \epsilon)`, which still
+    avoids division by zero but does not perturb the weights when
+    :math:`\sigma^r \gg \epsilon`.
+
     :param normalise: re-normalise the weights?
     :param power: power :math:`p` of the denominator
-    :param epsilon: :math:`\epsilon`
+    :param epsilon: :math:`\epsilon` (default: ``1.0e-6``, or
+                    :math:`10^{-\lfloor 4/p \rfloor}` for half precision
+                    so that :math:`\epsilon^{-p}` does not overflow)
+    :param fast_math: use ``native_recip`` for the reciprocals (OpenCL only)
+    :param fmax: bound :math:`\sigma^r` below by :math:`\epsilon` instead
+                 of adding :math:`\epsilon`
 
     If *normalise* is ``False`` the weights are not re-normalised.
     Instead, the re-normalisation occurs during the reconstruction
@@ -152,9 +270,10 @@ class KernelGenerator(object):
 
     """
 
-    from symbols import real, omega, sigma
+    import symbols
+    from symbols import real, omega, sigma, recip, native_recip
 
-    kernel = Kernel()
+    kernel = Kernel(self.lang, self.dtype)
 
     varpi = varpi or getattr(self, 'varpi', None)
     split = split or getattr(self, 'split', None)
@@ -171,27 +290,51 @@ class KernelGenerator(object):
 
     self.weights_normalised = normalise
 
-    epsilon = real(epsilon)
+    if epsilon is None and self.dtype == 'half':
+      # keep epsilon**-power (the largest weight) well below HALF_MAX
+      epsilon = '1.0e-%d' % (4 // power)
+    elif epsilon is None:
+      epsilon = '1.0e-6'
+    epsilon = str(epsilon)
+    if self.lang == 'fortran':
+      # double precision literal, so that eg max(sigma0, eps) has matching kinds
+      epsilon = re.sub('[eE]', 'd', epsilon) if re.search('[eEdD]', epsilon) else epsilon + 'd0'
+    epsilon = real(epsilon + _suffixes[self.dtype])
     accsym  = real('acc')
 
+    if fast_math and self.lang == 'opencl':
+      reciprocal = native_recip
+    else:
+      reciprocal = lambda x: 1 / x
+
+    if fmax:
+      denominator = lambda r: symbols.fmax(sigma[r], epsilon)
+    else:
+      denominator = lambda r: sigma[r] + epsilon
+
+    for r in range(0, k):
+      kernel.assign(recip[r], reciprocal(denominator(r)))
+      if power != 1:
+        kernel.assign(recip[r], recip[r]**power)
+
     for l in range(n):
 
       if not split[l]:
         for r in range(0, k):
-          kernel.assign(omega[l,r], varpi[l,r] / (sigma[r] + epsilon)**power)
+          kernel.assign(omega[l,r], varpi[l,r] * recip[r])
         if normalise:
-          kernel.assign(accsym, sum([ omega[l,r] for r in range(0, k) ]))
+          kernel.assign(accsym, reciprocal(sum([ omega[l,r] for r in range(0, k) ])))
           for r in range(0, k):
-            kernel.assign(omega[l,r], omega[l,r] / accsym)
+            kernel.assign(omega[l,r], omega[l,r] * accsym)
 
       else:
         for s, pm in enumerate(('p', 'm')):
           for r in range(0, k):
-            kernel.assign(omega[l,r,s], varpi[l,r][s] / scale[l,s] / (sigma[r] + epsilon)**power)
+            kernel.assign(omega[l,r,s], varpi[l,r][s] / scale[l,s] * recip[r])
           if normalise:
-            kernel.assign(accsym, sum([ omega[l,r,s] for r in range(0, k) ]))
+            kernel.assign(accsym, reciprocal(sum([ omega[l,r,s] for r in range(0, k) ])))
             for r in range(0, k):
-              kernel.assign(omega[l,r,s], omega[l,r,s] / accsym)
+              kernel.assign(omega[l,r,s], omega[l,r,s] * accsym)
 
     self.varpi = varpi
     self.split = split
@@ -200,18 +343,28 @@ class KernelGenerator(object):
 
   #############################################################################
 
-  def reconstruction(self, coeffs=None):
+  def reconstruction(self, coeffs=None, rolled=False):
     r"""Fully un-rolled reconstruction kernel for uniform grids.
 
     The reconstruction kernel computes the WENO reconstruction
     based on the weights *omega* (which have already been
     computed) and the reconstruction coefficients *coeffs*.
 
+    If the generator was created with *fma* set, the sums over *j*
+    and *r* are emitted as nested ``fma(a, b, acc)`` calls so that
+    each term costs a single fused multiply-add.
+
+    If *rolled* is ``True`` (C and OpenCL only), the reconstruction
+    coefficients are stored in constant arrays and the intermediate
+    reconstructions are computed by short loops over *j* instead.  As
+    with :meth:`smoothness`, the constant array declarations are
+    added to the *constants* attribute.
+
     """
 
-    from symbols import omega, fs, fr, f
+    from symbols import names, omega, fs, fr, f
 
-    kernel = Kernel()
+    kernel = Kernel(self.lang, self.dtype)
 
     if coeffs is None:
       coeffs = getattr(self, 'coeffs', symbolic.reconstruction_coefficients(self.k, self.xi))
@@ -229,43 +382,116 @@ class KernelGenerator(object):
                                          for l in range(n)
                                          for s in (0, 1) if split[l] }
 
+    dot = _fma_dot if self.fma else _dot
+
     # reconstructions
-    for l in range(n):
-      for r in range(k):
-        v = sum([ coeffs[l,r,j] * f[-r+j] for j in range(nc) ])
-        kernel.assign(fr[l,r], v)
+    if rolled:
+      self._check_lang('rolled')
+      for l in range(n):
+        for r in range(k):
+          c, fj = names.coeffs.format(l, r), f.expr('+j%+d' % -r)
+          kernel.constant(c, [ coeffs[l,r,j] for j in range(nc) ])
+          kernel.src.append('%s = %s;' % (fr[l,r], kernel.zero))
+          if self.fma:
+            body = '%s = fma(%s[j], %s, %s);' % (fr[l,r], c, fj, fr[l,r])
+          else:
+            body = '%s += %s[j] * %s;' % (fr[l,r], c, fj)
+          kernel.loop('j', nc, body)
+    else:
+      for l in range(n):
+        for r in range(k):
+          v = dot([ (coeffs[l,r,j], f[-r+j]) for j in range(nc) ])
+          kernel.assign(fr[l,r], v)
 
     # weighted reconstruction
     for l in range(n):
       if not split[l]:
-        v = sum([ omega[l,r] * fr[l,r] for r in range(k) ])
+        v = dot([ (omega[l,r], fr[l,r]) for r in range(k) ])
         if not self.weights_normalised:
            v /= sum([ omega[l,r] for r in range(k) ])
       else:
-        vp = sum([ omega[l,r,0] * fr[l,r] for r in range(k) ])
+        vp = dot([ (omega[l,r,0], fr[l,r]) for r in range(k) ])
         if not self.weights_normalised:
           vp /= sum([ omega[l,r,0] for r in range(k) ])
-        vm = sum([ omega[l,r,1] * fr[l,r] for r in range(k) ])
+        vm = dot([ (omega[l,r,1], fr[l,r]) for r in range(k) ])
         if not self.weights_normalised:
           vm /= sum([ omega[l,r,1] for r in range(k) ])
         v = scale[l,0] * vp - scale[l,1] * vm
 
       kernel.assign(fs[l], v)
 
+    self._declare(kernel)
     return kernel.body()
 
+  def _declare(self, kernel):
+    """Add the constant declarations of *kernel* to *constants*."""
+    self._declarations.update(kernel.constants)
+    self.constants = '\n'.join(self._declarations.values())
+
+  def _check_lang(self, feature):
+    if self.lang == 'fortran':
+      raise ValueError('%s kernels are only supported for C and OpenCL' % feature)
+
 
 ###############################################################################
 # helpers
 
+_dtypes = {
+  'c':       ('double', 'float'),
+  'opencl':  ('double', 'float', 'half'),
+  'fortran': ('double',),
+  }
+
+_suffixes = { 'double': '', 'float': 'f', 'half': 'h' }
+
+_extensions = {
+  ('opencl', 'double'): '#pragma OPENCL EXTENSION cl_khr_fp64 : enable',
+  ('opencl', 'half'):   '#pragma OPENCL EXTENSION cl_khr_fp16 : enable',
+  }
+
+def _dot(terms):
+  """Sum the products of the (a, b) pairs in *terms*."""
+  return sum([ a * b for a, b in terms ])
+
+def _fma_dot(terms):
+  """Sum the products of the (a, b) pairs in *terms* as a chain of
+  fused multiply-adds."""
+  from symbols import fma
+  terms = [ (a, b) for a, b in terms if a != 0 ]
+  if not terms:
+    return sympy.S.Zero
+  a, b = terms[0]
+  v = a * b
+  for a, b in terms[1:]:
+    v = a * b + v if abs(a) == 1 else fma(a, b, v)
+  return v
+
 class Kernel(object):
-  def __init__(self):
-    import symbols
-    if symbols.names.lang == 'fortran':
+  def __init__(self, lang, dtype):
+    self.lang  = lang
+    self.dtype = dtype
+    if self.lang == 'fortran':
       self.code = codeprinters.FCodePrinter(settings={'source_format': 'free'})
     else:
-      self.code = codeprinters.CCodePrinter()
+      self.code = codeprinters.CCodePrinter(
+        settings={'float_suffix': _suffixes[self.dtype]})
+    self.zero = '0.0' + _suffixes[self.dtype]
     self.src = []
+    self.constants = OrderedDict()
+  def constant(self, name, values, ctype=None):
+    ctype = ctype or self.dtype
+    qualifier = '__constant' if self.lang == 'opencl' else 'static const'
+    if ctype == 'int':
+      values = [ str(v) for v in values ]
+    else:
+      values = [ self.code.doprint(sympy.sympify(v).evalf(35)) for v in values ]
+    self.constants[name] = ('%s %s %s[%d] = { %s };'
+                            % (qualifier, ctype, name, len(values), ', '.join(values)))
+  def loop(self, var, count, body):
+    if self.lang == 'opencl':
+      self.src.extend([ '#if defined(cl_nv_pragma_unroll)', '#pragma unroll', '#endif' ])
+    self.src.append('for (int %s = 0; %s < %d; %s++)' % (var, var, count, var))
+    self.src.append('  ' + body)
   def assign(self, dest, value):
     if isinstance(self.code, codeprinters.CCodePrinter):
       self.src.append(str(dest) + ' = ' + self.code.doprint(value.evalf(35)) + ';')
@@ -0,0 +1,360 @@
+"""PyWENO OpenCL kernel generators.
+
+The routines in this module assemble the snippets generated by
+:class:`pyweno.kernels.KernelGenerator` into complete OpenCL kernels.
+The :class:`WenoContext` helper builds and runs these kernels, and
+requires PyOpenCL.
+
+Generated sources are memoized per process, and built programs are
+cached both per process and on disk (see :func:`build_program`).
+
+"""
+
+import hashlib
+import os
+import re
+
+from textwrap import dedent
+
+import numpy as np
+
+import kernels
+import symbols
+
+
+fused_template = dedent('''\
+    %(preamble)s
+    #pragma OPENCL FP_CONTRACT ON
+
+    __kernel %(attributes)svoid
+    %(name)s(const int n,
+      __global const %(T)s * restrict f,
+      __global %(T)s * restrict fr)
+    {
+      const int i = get_global_id(0);
+      __private %(T)s fw[%(nw)d];
+      __private %(T)s %(variables)s;
+    %(tile)s
+      if (i < %(km1)d || i >= n - %(km1)d)
+        return;
+
+    %(load)s
+
+    %(kernel)s
+
+    %(store)s
+    }
+    ''')
+
+tile_template = dedent('''\
+    __local %(T)s ft[%(nt)d];
+    const int l  = get_local_id(0);
+    const int i0 = get_group_id(0) * %(wg)d - %(km1)d;
+    const int lo = max(i0, 0);
+    const int hi = min(i0 + %(nt)d, n);
+    event_t e = async_work_group_copy(ft + (lo - i0), f + lo, hi - lo, 0);
+    wait_group_events(1, &e);
+    ''')
+
+_sources  = {}
+_programs = {}
+
+
+def uniform_fused_kernel(order, xi, name='weno', dtype='double',
+                         squares=False, fast_math=False, vector=True,
+                         workgroup_size=None):
+  """Return the source of an OpenCL kernel that computes the smoothness
+  indicators, weights, and reconstructions of a WENO scheme in one pass.
+
+  :param order:     order of the reconstruction (odd)
+  :param xi:        reconstruction points in :math:`[-1, 1]`
+  :param name:      name of the kernel
+  :param dtype:     ``'double'``, ``'float'``, or ``'half'``
+  :param squares:   compute the smoothness indicators as sums of squares
+  :param fast_math: use ``native_recip`` for the weights
+  :param vector:    load the stencil with ``vloadN`` (default: ``True``)
+  :param workgroup_size: stage the cell averages through ``__local``
+                    memory in work-groups of this size (optional)
+
+  The kernel takes the number of cells ``n``, the cell averages ``f``
+  and the reconstructions ``fr`` (stored as ``fr[i*len(xi) + l]``) as
+  arguments, and should be enqueued with a global size of (at least)
+  ``n``.  The buffers are declared ``restrict`` and contraction into
+  fused multiply-adds is enabled.  The stencil of each cell is loaded
+  once into private memory, and the smoothness indicators and weights
+  are never written to global memory.  If *vector* is ``True``, the
+  stencil is loaded with as few ``vloadN`` calls as possible (without
+  reading past the stencil).  As with the compiled kernels, the first
+  and last ``(order-1)/2`` cells are not reconstructed.
+
+  If *workgroup_size* is given, each work-group first copies the cell
+  averages it needs (its own cells plus ``(order-1)/2`` on either side,
+  clipped to ``[0, n)``) into a ``__local`` tile with
+  ``async_work_group_copy``, and the stencils are loaded from the tile.
+  Each cell average is then read from global memory once per
+  work-group instead of once per stencil that uses it.  The kernel
+  must be enqueued with a local size of *workgroup_size* (and a global
+  size rounded up to a multiple of it).
+
+  The source is memoized on the arguments, so repeated calls are free.
+
+  """
+
+  key = (order, tuple(xi), name, dtype, squares, fast_math, vector, workgroup_size)
+  if key in _sources:
+    return _sources[key]
+
+  k = (order + 1) / 2
+  n = len(xi)
+
+  lang_f = symbols.names.f['opencl']
+  try:
+    symbols.names.f['opencl'] = 'fw[%d{:+d}]' % (k-1)
+
+    gen = kernels.KernelGenerator('opencl', order=order, xi=xi, dtype=dtype)
+    ksmoothness = gen.smoothness(squares=squares)
+    # normalised half precision weights are at most one, so that the
+    # weighted sums in the reconstruction can not overflow
+    kweights = gen.weights(normalise=(dtype == 'half'), fast_math=fast_math)
+    kreconstruction = gen.reconstruction()
+  finally:
+    symbols.names.f['opencl'] = lang_f
+
+  variables = [ x['name'] for x in symbols.sigma.all(k) ] \
+            + [ x['name'] for x in symbols.omega.all(n, k, gen.split) ] \
+            + [ x['name'] for x in symbols.fr.all(n, k) ] \
+            + [ x['name'] for x in symbols.fs.all(n) ] \
+            + [ x['name'] for x in symbols.recip.all(k) ] \
+            + [ 'acc' ]
+
+  if workgroup_size:
+    src, index, offset = 'ft', 'l', 0
+    attributes = '__attribute__((reqd_work_group_size(%d, 1, 1))) ' % workgroup_size
+    tile = _indent(tile_template % {
+      'T': dtype, 'wg': workgroup_size, 'km1': k-1, 'nt': workgroup_size + 2*(k-1) })
+  else:
+    src, index, offset = 'f', 'i', -k+1
+    attributes, tile = '', ''
+
+  if vector:
+    load = _vector_load(dtype, 2*k-1, offset, src, index)
+  else:
+    load = [ 'fw[%d] = %s[%s%+d];' % (d, src, index, d+offset) for d in range(2*k-1) ]
+  store = [ 'fr[i*%d+%d] = %s;' % (n, l, symbols.fs[l]) for l in range(n) ]
+
+  _sources[key] = fused_template % {
+    'preamble':  gen.preamble,
+    'attributes': attributes,
+    'tile':      tile,
+    'name':      name,
+    'T':         dtype,
+    'nw':        2*k-1,
+    'km1':       k-1,
+    'variables': ', '.join(variables),
+    'load':      _indent('\n'.join(load)),
+    'kernel':    _indent('\n'.join([ ksmoothness, kweights, kreconstruction ])),
+    'store':     _indent('\n'.join(store)),
+    }
+  return _sources[key]
+
+
+def build_program(ctx, src, options=(), cache_dir=None):
+  """Build the OpenCL program *src* for all devices in *ctx*, re-using
+  previously built program binaries where possible.
+
+  :param ctx:       PyOpenCL context
+  :param src:       program source
+  :param options:   build options
+  :param cache_dir: directory of the disk cache (default:
+                    ``$PYWENO_CACHE_DIR`` or ``~/.cache/pyweno``), or
+                    ``False`` to disable it
+
+  Programs are cached in-process on the context, source and options.
+  On disk, the binary of each device is stored in
+  ``<device>_<hash>.clbin``, where the hash covers the source, the
+  options, and the device, platform and driver versions.  If any
+  binary is missing (or fails to load) the program is built from
+  source and the binaries are saved.
+
+  """
+
+  import pyopencl as cl
+
+  options = tuple(options)
+  key = (ctx.int_ptr, src, options)
+  if key in _programs:
+    return _programs[key]
+
+  if cache_dir is None:
+    cache_dir = os.environ.get('PYWENO_CACHE_DIR',
+                               os.path.join(os.path.expanduser('~'), '.cache', 'pyweno'))
+
+  program = None
+  if cache_dir:
+    paths = [ os.path.join(cache_dir, _binary_name(device, src, options))
+              for device in ctx.devices ]
+    if all([ os.path.exists(path) for path in paths ]):
+      binaries = []
+      for path in paths:
+        with open(path, 'rb') as f:
+          binaries.append(f.read())
+      try:
+        program = cl.Program(ctx, ctx.devices, binaries).build(list(options))
+      except cl.Error:
+        program = None
+
+  if program is None:
+    program = cl.Program(ctx, src).build(list(options))
+    if cache_dir:
+      _save_binaries(program, cache_dir, src, options)
+
+  _programs[key] = program
+  return program
+
+
+class WenoContext(object):
+  """Build the fused WENO kernel once and run it on NumPy arrays.
+
+  :param order:     order of the reconstruction (odd)
+  :param xi:        reconstruction points in :math:`[-1, 1]`
+  :param ctx:       PyOpenCL context (optional)
+  :param queue:     PyOpenCL command queue (optional)
+  :param dtype:     ``'double'``, ``'float'``, or ``'half'``
+  :param cache_dir: program binary cache (see :func:`build_program`)
+
+  Any remaining keyword arguments are passed to
+  :func:`uniform_fused_kernel`.
+
+  The cell averages and reconstructions are stored in buffers
+  allocated with ``ALLOC_HOST_PTR``, which are mapped into host memory
+  to copy data in and out.  On devices that share memory with the host
+  this avoids any copies over the bus, and otherwise lets the driver
+  use pinned memory for the transfers.  The buffers are re-allocated
+  whenever the size of the input changes.
+
+  """
+
+  dtypes = { 'double': np.float64, 'float': np.float32, 'half': np.float16 }
+
+  def __init__(self, order, xi, ctx=None, queue=None, dtype='double',
+               cache_dir=None, **kwargs):
+    import pyopencl as cl
+
+    self.cl    = cl
+    self.ctx   = ctx or cl.create_some_context(interactive=False)
+    self.queue = queue or cl.CommandQueue(self.ctx)
+    self.dtype = np.dtype(self.dtypes[dtype])
+    self.k     = (order + 1) // 2
+    self.n     = len(xi)
+    self.workgroup_size = kwargs.get('workgroup_size')
+
+    src = uniform_fused_kernel(order, xi, dtype=dtype, **kwargs)
+    self.program = build_program(self.ctx, src, cache_dir=cache_dir)
+    self.kernel  = cl.Kernel(self.program, kwargs.get('name', 'weno'))
+
+    self.size = None
+
+  def allocate(self, size):
+    """Allocate host accessible buffers for *size* cells."""
+
+    mf = self.cl.mem_flags
+    nbytes = size * self.dtype.itemsize
+    self.f_buf  = self.cl.Buffer(self.ctx, mf.READ_ONLY | mf.ALLOC_HOST_PTR, nbytes)
+    self.fr_buf = self.cl.Buffer(self.ctx, mf.WRITE_ONLY | mf.ALLOC_HOST_PTR, self.n * nbytes)
+    self.size = size
+
+  def reconstruct(self, q):
+    """Reconstruct the cell averages *q* and return an array of shape
+    ``(len(q), len(xi))``.
+
+    As with :func:`pyweno.weno.reconstruct`, the first and last
+    ``(order-1)/2`` cells are set to zero.
+    """
+
+    cl, queue = self.cl, self.queue
+
+    q = np.asarray(q)
+    if q.shape[0] == 0:
+      return np.zeros((0, self.n), self.dtype)
+    if q.shape[0] != self.size:
+      self.allocate(q.shape[0])
+
+    f, _ = cl.enqueue_map_buffer(queue, self.f_buf, cl.map_flags.WRITE, 0,
+                                 (self.size,), self.dtype)
+    f[:] = q
+    f.base.release(queue)
+
+    if self.workgroup_size:
+      wg = self.workgroup_size
+      global_size, local_size = (-(-self.size // wg) * wg,), (wg,)
+    else:
+      global_size, local_size = (self.size,), None
+
+    self.kernel(queue, global_size, local_size,
+                np.int32(self.size), self.f_buf, self.fr_buf)
+
+    fr, _ = cl.enqueue_map_buffer(queue, self.fr_buf, cl.map_flags.READ, 0,
+                                  (self.size, self.n), self.dtype)
+    qr = fr.copy()
+    fr.base.release(queue)
+
+    # the kernel does not write the boundary cells
+    qr[:self.k-1] = 0
+    qr[max(self.size-self.k+1, 0):] = 0
+
+    return qr
+
+
+def _vector_load(dtype, width, offset, src='f', index='i'):
+  """Load *width* values starting at src[index+offset] into fw using vloadN."""
+
+  load, d, w = [], 0, 0
+  while d < width:
+    size = max([ s for s in (16, 8, 4, 3, 2, 1) if s <= width - d ])
+    if size == 1:
+      load.append('fw[%d] = %s[%s%+d];' % (d, src, index, d+offset))
+    else:
+      v = 'w%d' % w
+      load.append('%s%d %s = vload%d(0, %s + %s%+d);'
+                  % (dtype, size, v, size, src, index, d+offset))
+      load.extend([ 'fw[%d] = %s.s%x;' % (d+j, v, j) for j in range(size) ])
+      w += 1
+    d += size
+
+  return load
+
+
+def _binary_name(device, src, options):
+  """Return the file name of the cached binary of *src* for *device*."""
+
+  h = hashlib.sha1()
+  for x in (src, ' '.join(options), device.name, device.version,
+            device.driver_version, device.platform.version):
+    h.update(x.encode('utf-8'))
+
+  return '%s_%s.clbin' % (re.sub(r'[^\w.-]+', '_', device.name.strip()), h.hexdigest())
+
+
+def _save_binaries(program, cache_dir, src, options):
+  """Save the binaries of *program* to *cache_dir* (ignoring errors)."""
+
+  import pyopencl as cl
+
+  devices  = program.get_info(cl.program_info.DEVICES)
+  binaries = program.get_info(cl.program_info.BINARIES)
+
+  try:
+    if not os.path.isdir(cache_dir):
+      os.makedirs(cache_dir)
+    for device, binary in zip(devices, binaries):
+      path = os.path.join(cache_dir, _binary_name(device, src, options))
+      tmp  = '%s.%d' % (path, os.getpid())
+      with open(tmp, 'wb') as f:
+        f.write(binary)
+      os.rename(tmp, path)
+  except (IOError, OSError):
+    pass
+
+
+def _indent(src, prefix='  '):
+  return '\n'.join([ prefix + line if line else line for line in src.split('\n') ])
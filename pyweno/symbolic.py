@@ -184,37 +184,83 @@ def jiang_shu_smoothness_coefficients(k):
       \beta_{r,m,n}\, \overline{f}_{i-k+m}\, \overline{f}_{i-k+n}.
   """
 
-  x, dx, xi = sym('x'), sym('dx'), sym('x')
+  x = sym('x')
 
-  # build arrays of cell boundaries and cell averages
-  xs = [ j*dx               for j in range(-k+1, k+1) ]
-  fs = [ sym('f[i%+d]' % j) for j in range(-k+1, k)   ]
+  # the coefficients do not depend on the grid spacing, so use a unit
+  # spacing and the cell [0, 1]
+  xs = range(-k+1, k+1)
 
   beta = { 'k': k }
 
   # compute smoothness coefficients for each left shift r
   for r in range(k):
-    p = ppi(xs[k-1-r:2*k-r], fs[k-1-r:2*k-1-r]).diff(x)
+
+    # since the reconstruction is linear in the cell averages, build
+    # one (rational) polynomial per cell average
+    phi = []
+    for m in range(k):
+      unit = [ 0 ] * k
+      unit[m] = 1
+      phi.append(sympy.Poly(ppi(xs[k-1-r:2*k-r], unit).diff(x), x))
 
     # sum of L^2 norms of derivatives
-    s = 0
+    s = {}
     for j in range(1, k):
-      pp = sympy.diff(p, xi, j)**2
-      pp = pp.as_poly(x)
-      pp = pp.integrate(x)
-      pp = dx**(2*j-1) * ( pp.subs(x, xs[k]) - pp.subs(x, xs[k-1]) )
-      s += pp.expand()
+      dphi = [ p.diff((x, j)) for p in phi ]
+      for m in range(k):
+        for n in range(m, k):
+          pp = (dphi[m] * dphi[n]).integrate()
+          pp = pp.eval(1) - pp.eval(0)
+          s[m, n] = s.get((m, n), 0) + (pp if m == n else 2*pp)
 
-    # pick out coefficients
     for m in range(k):
       for n in range(m, k):
-        c = s.coeff(fs[k-1-r+m]*fs[k-1-r+n])
-        if c is not None:
-          beta[r, m, n] = c
+        beta[r, m, n] = sympy.sympify(s[m, n])
 
   return beta
 
 
+###############################################################################
+
+def smoothness_sum_of_squares(beta):
+  r"""Factor the smoothness coefficients *beta* into a sum of squares.
+
+  Each quadratic form :math:`\sigma^r` is factored (using an
+  :math:`LDL^T` decomposition) according to
+
+  .. math::
+
+    \sigma^r = \sum_s c_{r,s} \Bigl( \sum_j L_{r,s,j}\,
+      \overline{f}_{i-r+j} \Bigr)^2.
+
+  The factors are returned as two dictionaries indexed according to
+  ``c[r, s]`` and ``L[r, s, j]``.  Terms with :math:`c_{r,s} = 0` are
+  omitted, and ``L[r, s, j]`` is only stored for :math:`j \geq s`.
+  """
+
+  k  = beta.get('k', 0)
+  nc = beta.get('l', k)
+
+  c = { 'k': k, 'l': nc }
+  L = { 'k': k, 'l': nc }
+
+  half = sympy.Rational(1, 2)
+
+  for r in range(k):
+    B = sympy.Matrix(nc, nc, lambda m, n: beta[r, min(m, n), max(m, n)]
+                                          * (1 if m == n else half))
+    Lr, Dr = B.LDLdecomposition()
+
+    for s in range(nc):
+      if Dr[s, s] == 0:
+        continue
+      c[r, s] = Dr[s, s]
+      for j in range(s, nc):
+        L[r, s, j] = Lr[j, s]
+
+  return c, L
+
+
 ###############################################################################
 
 def reconstruction_coefficients_for_derivative(k, bias):
@@ -1,5 +1,6 @@
 """PyWENO symbol generators."""
 
+import numpy as np
 import sympy
 
 real = lambda x: sympy.Symbol(str(x), real=True)
@@ -7,10 +8,14 @@ real = lambda x: sympy.Symbol(str(x), real=True)
 class names(object):
   lang   = 'c'
   sigma  = 'sigma{}'
+  recip  = 'recip{}'
   omega  = 'omega{}r{}'
   f_star = 'fs{}'
   f_r    = 'fr{}r{}'
   f_mn   = 'f{:+d}{:+d}'
+  beta   = 'beta{}'
+  beta_i = 'beta_{}'
+  coeffs = 'coeffs{}r{}'
   f = {
     'c':       'f[(i{:+d})*fsi]',
     'opencl':  'f[(i{:+d})*fsi]',
@@ -26,6 +31,15 @@ class SigmaGenerator(object):
 
 sigma = SigmaGenerator()
 
+class RecipGenerator(object):
+  def __getitem__(self, idx):
+    tmp = getattr(names, 'recip')
+    return real(tmp.format(idx))
+  def all(self, k):
+    return [ { 'r': r, 'name': str(self[r]) } for r in range(0, k) ]
+
+recip = RecipGenerator()
+
 class OmegaGenerator(object):
   def __getitem__(self, idx):
     tmp = getattr(names, 'omega')
@@ -68,6 +82,10 @@ class FGenerator(object):
   def __getitem__(self, idx):
     tmp = getattr(names, 'f')[names.lang]
     return real(tmp.format(idx))
+  def expr(self, offset):
+    """Return the source for f at the (run-time) offset *offset*."""
+    tmp = getattr(names, 'f')[names.lang]
+    return tmp.replace('{:+d}', '{}').format(offset)
 
 f = FGenerator()
 
@@ -75,5 +93,45 @@ class FMNGenerator(object):
   def __getitem__(self, idx):
     tmp = getattr(names, 'f_mn')
     return real(tmp.format(*idx).replace('-','m').replace('+','p'))
+  def pairs(self, k, nc=None):
+    nc = nc or k
+    M, N = np.triu_indices(nc)
+    pairs, seen = [], set()
+    for r in range(k):
+      for mn in zip((M-r).tolist(), (N-r).tolist()):
+        if mn not in seen:
+          seen.add(mn)
+          pairs.append(mn)
+    return pairs
+  def all(self, k, nc=None):
+    return [ { 'm': m, 'n': n, 'name': str(self[m,n]) } for m, n in self.pairs(k, nc) ]
 
 fmn = FMNGenerator()
+
+class fma(sympy.Function):
+  """Fused multiply-add: ``fma(a, b, c) = a*b + c``.
+
+  Kept unevaluated so that the code printers can emit a single
+  ``fma`` call for C-like languages.
+  """
+
+  nargs = 3
+
+  def _eval_evalf(self, prec):
+    return self.func(*[ arg._evalf(prec) for arg in self.args ])
+
+class fmax(sympy.Function):
+  """Maximum of two floating point numbers: ``fmax(a, b)``."""
+
+  nargs = 2
+
+  def _eval_evalf(self, prec):
+    return self.func(*[ arg._evalf(prec) for arg in self.args ])
+
+class native_recip(sympy.Function):
+  """Fast (reduced precision) OpenCL reciprocal: ``native_recip(x) = 1/x``."""
+
+  nargs = 1
+
+  def _eval_evalf(self, prec):
+    return self.func(*[ arg._evalf(prec) for arg in self.args ])
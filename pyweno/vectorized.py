@@ -0,0 +1,176 @@
+"""PyWENO vectorized (NumPy) WENO reconstructor.
+
+The routines in this module perform the same uniform-grid WENO
+reconstructions as :func:`pyweno.weno.reconstruct`, but operate on
+whole arrays at once using NumPy instead of calling the compiled
+kernels.  The coefficients are computed with :mod:`pyweno.symbolic`
+(and hence require SymPy) the first time a given reconstruction is
+requested, and are cached as NumPy arrays thereafter.
+
+"""
+
+import numpy as np
+
+_cache = {}
+
+
+def coefficients(k, points, n=None):
+  """Return the (cached) NumPy coefficient tables for the 2k-1 order
+  WENO reconstruction at *points*.
+
+  :param k:      order of reconstruction (odd)
+  :param points: reconstruction points (see :func:`reconstruct`)
+  :param n:      number of reconstruction points (optional)
+
+  The returned tuple ``(beta, varpi, coeffs)`` contains the
+  smoothness coefficients *beta* indexed according to ``beta[r,m,n]``,
+  the (split) optimal weights *varpi* indexed according to
+  ``varpi[l,r,s]``, and the reconstruction coefficients *coeffs*
+  indexed according to ``coeffs[l,r,j]``.  Weights that do not need
+  to be split have ``varpi[l,r,1] = 0``.
+
+  """
+
+  key = (k, points, n)
+  if key in _cache:
+    return _cache[key]
+
+  import pyweno.points
+  import pyweno.symbolic
+
+  xi = { 'left': [ -1 ], 'right': [ 1 ], 'middle': [ 0 ] }.get(points)
+  if xi is None:
+    xi = getattr(pyweno.points, points)(n)
+
+  k = (k+1)/2
+  n = len(xi)
+
+  sbeta = pyweno.symbolic.jiang_shu_smoothness_coefficients(k)
+  svarpi, split = pyweno.symbolic.optimal_weights(k, xi)
+  scoeffs = pyweno.symbolic.reconstruction_coefficients(k, xi)
+
+  beta = np.zeros((k, k, k))
+  for r in range(k):
+    for m in range(k):
+      for j in range(m, k):
+        beta[r,m,j] = float(sbeta[r,m,j])
+
+  varpi = np.zeros((n, k, 2))
+  for l in range(n):
+    for r in range(k):
+      if split[l]:
+        varpi[l,r,:] = [ float(w) for w in svarpi[l,r] ]
+      else:
+        varpi[l,r,0] = float(svarpi[l,r])
+
+  coeffs = np.zeros((n, k, k))
+  for l in range(n):
+    for r in range(k):
+      for j in range(k):
+        coeffs[l,r,j] = float(scoeffs[l,r,j])
+
+  _cache[key] = (beta, varpi, coeffs)
+  return _cache[key]
+
+
+def reconstruct(q, k, points, n=None,
+                return_smoothness=False,
+                return_weights=False,
+                squeeze=True,
+                epsilon=1.0e-6):
+  """Perform WENO reconstruction of q using NumPy.
+
+  :param q:                 cell-averaged unknown to reconstruct
+  :param k:                 order of reconstruction (odd)
+  :param points:            reconstruction points
+  :param n:                 number of reconstruction points (optional)
+  :param return_smoothness: return smoothness indicators? (default: ``False``)
+  :param return_weights:    return weights? (default: ``False``)
+  :param squeeze:           squeeze the results? (default: ``True``)
+  :param epsilon:           :math:`\\epsilon` in the weights
+
+  Supported reconstruction points *points* are ``'left'``,
+  ``'right'``, ``'middle'``, ``'gauss_legendre'``,
+  ``'gauss_lobatto'``, and ``'gauss_radau'`` (see
+  :func:`pyweno.weno.reconstruct`).
+
+  As with the compiled kernels, the first and last ``(k-1)/2`` cells
+  are left as zero.
+
+  """
+
+  valid_points = [ 'left', 'right', 'middle',
+                   'gauss', 'gauss_legendre',
+                   'gauss_lobatto',
+                   'gauss_radau' ]
+
+  if (k % 2) == 0:
+    raise ValueError('even order WENO reconstructions are not supported')
+
+  if not (points in valid_points):
+    raise ValueError("'points' must be one of: " + ', '.join(valid_points))
+
+  if points == 'gauss':
+    points = 'gauss_legendre'
+
+  if points in [ 'left', 'right', 'middle' ]:
+    n = None
+  elif n is None:
+    n = (k+1)/2
+
+  beta, varpi, coeffs = coefficients(k, points, n)
+
+  q = np.asarray(q, np.float64)
+  N = q.shape[0]
+  n, k = coeffs.shape[:2]
+  M = max(N-2*k+2, 0)                   # number of interior cells
+
+  # shifted views: f[d] is q[i+d] for each interior cell i
+  f = dict((d, q[k-1+d:k-1+d+M]) for d in range(-k+1, k))
+
+  # smoothness
+  sigma = np.zeros((M, k))
+  for r in range(k):
+    for m in range(k):
+      for j in range(m, k):
+        sigma[:,r] += beta[r,m,j] * f[-r+m] * f[-r+j]
+
+  # weights (split into positive and negative parts)
+  alpha = varpi[np.newaxis,...] / (epsilon + sigma[:,np.newaxis,:,np.newaxis])**2
+  scale = varpi.sum(axis=1)
+  acc   = alpha.sum(axis=2)
+  acc[acc == 0] = 1.0
+  omega = alpha / acc[:,:,np.newaxis,:]
+
+  # reconstruct
+  qs = np.zeros((M, n))
+  for l in range(n):
+    for r in range(k):
+      fr = sum([ coeffs[l,r,j] * f[-r+j] for j in range(k) ])
+      qs[:,l] += (scale[l,0] * omega[:,l,r,0] - scale[l,1] * omega[:,l,r,1]) * fr
+
+  qr = np.zeros((N, n))
+  qr[k-1:k-1+M] = qs
+
+  smoothness = np.zeros((N, k))
+  smoothness[k-1:k-1+M] = sigma
+
+  weights = np.zeros((N, n, k))
+  weights[k-1:k-1+M] = (scale[np.newaxis,:,np.newaxis,0] * omega[...,0]
+                        - scale[np.newaxis,:,np.newaxis,1] * omega[...,1])
+
+  # done!
+  if squeeze:
+    qr = qr.squeeze()
+    weights = weights.squeeze()
+
+  if return_smoothness and return_weights:
+    return (qr, smoothness, weights)
+
+  if return_smoothness:
+    return (qr, smoothness)
+
+  if return_weights:
+    return (qr, weights)
+
+  return qr
@@ -77,7 +77,7 @@ setup(
         Extension('pyweno.cweno',
                   sources = ['src/cweno.c'] + glob.glob('src/weno*.c'),
                   include_dirs=[np.get_include()],
-                  extra_compile_args = ['-std=c99'],
+                  extra_compile_args = ['-std=c99', '-O3'],
                   ),
         Extension('pyweno.cnonuniform',
                   sources = ['src/nfweno.c', 'src/poly.c'],
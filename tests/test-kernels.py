@@ -5,15 +5,165 @@ def test_kernels():
 
   k = 3
 
-  for lang in ('c', 'fortran'):
+  for lang in ('c', 'opencl', 'fortran'):
     kernel = pyweno.kernels.KernelGenerator(lang, order=2*k-1, xi=[-1, 0, 1])
     kernel.smoothness(reuse=False)
     kernel.smoothness(reuse=True)
+    kernel.smoothness(squares=True)
     kernel.weights()
     kernel.reconstruction()
 
 
-if __name__ == '__main__':
-  test_kernels()
+def test_fma():
+
+  k = 3
+
+  kernel = pyweno.kernels.KernelGenerator('opencl', order=2*k-1, xi=[-1, 1])
+  kernel.weights()
+  src = kernel.reconstruction()
+  assert src.count('fma(') == 2*(k-1)*(k+1)
+
+  kernel = pyweno.kernels.KernelGenerator('c', order=2*k-1, xi=[-1, 1])
+  kernel.weights()
+  assert 'fma(' not in kernel.reconstruction()
+
+
+def test_rolled():
+
+  k = 3
+
+  kernel = pyweno.kernels.KernelGenerator('opencl', order=2*k-1, xi=[-1, 1])
+  src = kernel.smoothness(rolled=True)
+  assert src.count('for (int t = 0; t < 6; t++)') == k
+  assert '__constant int beta_m[6] = { 0, 0, 0, 1, 1, 2 };' in kernel.constants
+
+  kernel.weights()
+  src = kernel.reconstruction(rolled=True)
+  assert src.count('#pragma unroll') == 2*k
+  assert kernel.constants.count('__constant double coeffs') == 2*k
+
+  # the smoothness constants are kept alongside the reconstruction ones
+  for name in [ 'beta0', 'beta2', 'beta_m', 'beta_n', 'coeffs0r0', 'coeffs1r2' ]:
+    assert kernel.constants.count(' %s[' % name) == 1, name
+
+  kernel.smoothness(rolled=True)
+  assert kernel.constants.count(' beta0[') == 1
+
+
+def test_hoist():
+
+  k = 3
+
+  kernel = pyweno.kernels.KernelGenerator('c', order=2*k-1)
+  for reuse in (False, True):
+    src = kernel.smoothness(reuse=reuse, hoist=True)
+    assert 'beta2[5]*' in src and '3.33' not in src
+    assert kernel.constants.count('static const double beta') == k
+
+
+def test_weights():
+
+  k = 3
+
+  kernel = pyweno.kernels.KernelGenerator('c', order=2*k-1, xi=[-1, 1])
+  src = kernel.weights(normalise=True)
+  assert src.count('/') == k + 2
+  assert 'recip0 = recip0*recip0;' in src
+  assert 'omega0r0 = 0.1*recip0;' in src and 'omega1r0 = 0.3*recip0;' in src
 
+  kernel = pyweno.kernels.KernelGenerator('opencl', order=2*k-1, xi=[-1, 1])
+  src = kernel.weights(fast_math=True)
+  assert src.count('native_recip(') == k and '/' not in src
 
+  kernel = pyweno.kernels.KernelGenerator('opencl', order=2*k-1, xi=[0], dtype='float')
+  src = kernel.weights(fmax=True)
+  assert src.count('fmax(sigma') == k and '1.0e-6f + ' not in src
+  assert 'recip0 = 1.0f/fmax(sigma0, 1.0e-6f);' in src
+
+  kernel = pyweno.kernels.KernelGenerator('fortran', order=2*k-1, xi=[0])
+  src = kernel.weights(fmax=True)
+  assert src.count('max(sigma') == k and 'max(sigma0, 1.0d-6)' in src
+
+
+def test_products():
+
+  k = 3
+
+  kernel = pyweno.kernels.KernelGenerator('c', order=2*k-1)
+  src = kernel.smoothness(products=True)
+  names = [ x['name'] for x in pyweno.symbols.fmn.all(k) ]
+  assert len(names) == 12
+  assert src.count('*f[') == len(names)
+  for name in names:
+    assert src.count(name + ' = ') == 1
+
+
+def test_dtype():
+
+  k = 3
+
+  kernel = pyweno.kernels.KernelGenerator('opencl', order=2*k-1, xi=[-1, 1], dtype='float')
+  assert kernel.preamble == ''
+  src = kernel.weights(normalise=True)
+  assert 'recip0 = 1.0f/(1.0e-6f + sigma0);' in src
+  assert 'acc = 1.0f/(' in src
+  assert '1.8333333333333333333333333333333333f*' in kernel.reconstruction()
+
+  kernel = pyweno.kernels.KernelGenerator('opencl', order=2*k-1, xi=[-1, 1], dtype='half')
+  assert 'cl_khr_fp16' in kernel.preamble
+  src = kernel.weights(normalise=True)
+  assert '1.0e-2h + sigma0' in src
+
+  # run the half precision weights on smooth data (sigma = 0)
+  import re
+  import numpy as np
+  ns = dict(('sigma%d' % r, np.float16(0)) for r in range(k))
+  for line in src.split('\n'):
+    line = re.sub(r'(\d+\.\d*(e[+-]?\d+)?)h', r'np.float16(\1)', line.rstrip(';'))
+    exec(line, { 'np': np }, ns)
+  for name in ns:
+    assert ns[name].dtype == np.float16 and np.isfinite(ns[name]), name
+  assert abs(ns['omega0r0'] - 0.1) < 1e-3
+
+  # each generator keeps its own precision
+  a = pyweno.kernels.KernelGenerator('opencl', order=2*k-1, xi=[0], dtype='float')
+  b = pyweno.kernels.KernelGenerator('opencl', order=2*k-1, xi=[0], dtype='double')
+  src = a.weights(normalise=True) + a.reconstruction(rolled=True) + a.constants
+  assert 'recip0 = 1.0f/(1.0e-6f + sigma0);' in src
+  assert '__constant float coeffs0r0' in src and 'double' not in src
+  src = b.weights(normalise=True) + b.reconstruction(rolled=True) + b.constants
+  assert 'recip0 = 1.0/(1.0e-6 + sigma0);' in src
+  assert '__constant double coeffs0r0' in src and 'float' not in src
+
+  try:
+    pyweno.kernels.KernelGenerator('fortran', order=2*k-1, dtype='float')
+  except ValueError:
+    pass
+  else:
+    assert False, "Fortran kernels only support double precision"
+
+
+def test_offsets():
+
+  import re
+
+  for k in (3, 4):
+    for lang in ('c', 'opencl'):
+      kernel = pyweno.kernels.KernelGenerator(lang, order=2*k-1, xi=[-1])
+      src = kernel.smoothness() + kernel.reconstruction()
+      offsets = re.findall(r'f\[\(i([^)]*)\)\*fsi\]', src)
+      assert offsets
+      for offset in offsets:
+        assert re.match(r'^[+-]\d+$', offset), offset
+      assert set([ int(x) for x in offsets ]) == set(range(-k+1, k))
+
+
+if __name__ == '__main__':
+  test_kernels()
+  test_fma()
+  test_rolled()
+  test_hoist()
+  test_products()
+  test_weights()
+  test_dtype()
+  test_offsets()
@@ -0,0 +1,94 @@
+"""Test the PyWENO OpenCL kernel generators."""
+
+import os
+import re
+
+import pyweno.opencl
+
+
+def test_fused():
+
+  for order in (5, 7):
+    k = (order + 1) / 2
+    for squares in (False, True):
+      src = pyweno.opencl.uniform_fused_kernel(order, [-1, 1], squares=squares)
+      assert '__kernel void\nweno(' in src
+      assert 'vload4(0, f + i%+d);' % (-k+1) in src
+      assert src.count('fr[i*2+') == 2
+
+  src = pyweno.opencl.uniform_fused_kernel(5, [-1, 1], vector=False)
+  assert src.count('f[i') == 5 and 'vload' not in src
+
+  src = pyweno.opencl.uniform_fused_kernel(5, [0], dtype='float', fast_math=True)
+  assert 'cl_khr_fp64' not in src and 'double' not in src
+  assert 'native_recip(' in src
+
+  # no (double precision) floating point literals without a suffix
+  literal = re.compile(r'(?<![\w.])(\d+\.\d*|\.\d+)([eE][+-]?\d+)?(?![\w.])')
+  for dtype in ('float', 'half'):
+    for squares in (False, True):
+      src = pyweno.opencl.uniform_fused_kernel(5, [-1, 0, 1], dtype=dtype, squares=squares)
+      assert not literal.search(src), literal.search(src).group(0)
+
+  src = pyweno.opencl.uniform_fused_kernel(5, [-1, 1], workgroup_size=64)
+  assert '__local double ft[68];' in src
+  assert 'async_work_group_copy(' in src and 'reqd_work_group_size(64, 1, 1)' in src
+  assert 'vload4(0, ft + l+0);' in src and 'f[i' not in src
+
+
+def test_memoized():
+
+  src = pyweno.opencl.uniform_fused_kernel(5, [-1, 1])
+  assert pyweno.opencl.uniform_fused_kernel(5, (-1, 1)) is src
+  assert pyweno.opencl.uniform_fused_kernel(5, [-1, 1], vector=False) is not src
+
+
+def test_context():
+
+  import pytest
+  try:
+    import pyopencl as cl
+  except ImportError:
+    pytest.skip('pyopencl is not installed')
+  try:
+    ctx = cl.create_some_context(interactive=False)
+  except cl.Error as e:
+    pytest.skip('no OpenCL device available: %s' % e)
+
+  import shutil
+  import tempfile
+
+  import numpy as np
+  import pyweno.vectorized
+
+  cache_dir = tempfile.mkdtemp()
+  try:
+    x = np.linspace(0.0, 2*np.pi, 101)
+    q = (np.cos(x[:-1]) - np.cos(x[1:])) / (x[1] - x[0])
+    expected = pyweno.vectorized.reconstruct(q, 5, 'left')
+
+    for wg in (None, 32):
+      c = pyweno.opencl.WenoContext(5, [-1], ctx=ctx, cache_dir=cache_dir,
+                                    workgroup_size=wg)
+      qr = c.reconstruct(q)[:,0]
+      assert np.all(qr[:2] == 0) and np.all(qr[-2:] == 0)
+      assert np.allclose(qr, expected, rtol=1e-12, atol=1e-12)
+      assert np.all(c.reconstruct(q[:3]) == 0)
+      assert c.reconstruct(q[:0]).shape == (0, 1)
+
+    # built once, then re-used from memory and from disk
+    binaries = [ x for x in os.listdir(cache_dir) if x.endswith('.clbin') ]
+    assert len(binaries) == 2*len(ctx.devices)
+    src = pyweno.opencl.uniform_fused_kernel(5, [-1])
+    program = pyweno.opencl.build_program(ctx, src, cache_dir=cache_dir)
+    assert pyweno.opencl.build_program(ctx, src, cache_dir=cache_dir) is program
+    pyweno.opencl._programs.clear()
+    assert pyweno.opencl.build_program(ctx, src, cache_dir=cache_dir) is not program
+  finally:
+    shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+  test_fused()
+  test_memoized()
+  test_context()
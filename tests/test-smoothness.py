@@ -39,8 +39,23 @@ def test_smoothness():
             assert(exact[k][key] == beta[key])
 
 
+def test_sum_of_squares():
+
+    for k in K:
+        beta = pyweno.symbolic.jiang_shu_smoothness_coefficients(k)
+        c, L = pyweno.symbolic.smoothness_sum_of_squares(beta)
+        f = sympy.symbols('f0:%d' % k)
+        for r in range(k):
+            sigma = sum([ beta[r,m,n] * f[m] * f[n]
+                          for m in range(k) for n in range(m, k) ])
+            squares = sum([ c[r,s] * sum([ L[r,s,j] * f[j] for j in range(s, k) ])**2
+                            for s in range(k) if (r, s) in c ])
+            assert sympy.expand(sigma - squares) == 0
+
+
 ######################################################################
 
 
 if __name__ == '__main__':
     test_smoothness()
+    test_sum_of_squares()
@@ -0,0 +1,54 @@
+"""Test the PyWENO vectorized (NumPy) reconstructions."""
+
+import numpy as np
+
+import pyweno.weno
+import pyweno.vectorized
+
+
+def f(x):
+  return np.sin(x)
+
+def F(a, b):
+  return (-np.cos(b) - -np.cos(a))/(b-a)
+
+
+def test_vectorized():
+
+  K = (5, 7)
+  x = np.linspace(0.0, 2*np.pi, 51)
+  q = F(x[:-1], x[1:])
+
+  for k in K:
+    for points in ('left', 'right'):
+      qr, sigma, omega = pyweno.vectorized.reconstruct(
+        q, k, points, return_smoothness=True, return_weights=True)
+      qc, sc, oc = pyweno.weno.reconstruct(
+        q, k, points, return_smoothness=True, return_weights=True)
+
+      np.testing.assert_allclose(sigma[k:-k], sc[k:-k], rtol=1e-8, atol=1e-12)
+      np.testing.assert_allclose(omega[k:-k], oc[k:-k], rtol=1e-8, atol=1e-12)
+      np.testing.assert_allclose(qr[k:-k], qc[k:-k], rtol=1e-8, atol=1e-12)
+
+  qr = pyweno.vectorized.reconstruct(q, 5, 'gauss_legendre', n=2)
+  assert qr.shape == (q.size, 2)
+  assert abs(qr[5:-5].mean(axis=1) - q[5:-5]).max() < 1e-6
+
+
+def test_short():
+
+  # fewer cells than a stencil: everything is left as zero
+  for N in (1, 3, 4):
+    q = np.arange(N, dtype=np.float64)
+    for points in ('left', 'gauss'):
+      vr = pyweno.vectorized.reconstruct(
+        q, 5, points, return_smoothness=True, return_weights=True)
+      cr = pyweno.weno.reconstruct(
+        q, 5, points, return_smoothness=True, return_weights=True)
+      for v, c in zip(vr, cr):
+        assert v.shape == c.shape and not v.any() and not c.any()
+
+
+if __name__ == '__main__':
+  test_vectorized()
+  test_short()